@@ -1,10 +1,13 @@
 import os
 import tempfile
 import json
+import gzip
+import re
 import time
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
+from fastapi.encoders import jsonable_encoder
 from typing import List, Dict, Any
 import requests
 import base64
@@ -28,6 +31,12 @@ from langchain_core.output_parsers import JsonOutputParser
 from dotenv import load_dotenv
 load_dotenv()
 
+# Brotli is optional; responses fall back to gzip when it is not installed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 # Initialize FastAPI app
 app = FastAPI()
 
@@ -46,8 +55,73 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+# Negotiated response compression. Bodies smaller than the threshold are sent
+# as-is since compressing them costs more than it saves.
+COMPRESSION_MIN_SIZE = int(os.getenv("RESPONSE_COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+def negotiate_encoding(accept_encoding):
+    """Pick br or gzip from an Accept-Encoding header, honouring q=0 and *"""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip()] = quality
+
+    # Codings not listed by name take the quality of the * wildcard, if any
+    default_quality = accepted.get("*", 0)
+    if brotli is not None and accepted.get("br", default_quality) > 0:
+        return "br"
+    if accepted.get("gzip", default_quality) > 0:
+        return "gzip"
+    return None
+
+@app.middleware("http")
+async def compress_response(request: Request, call_next):
+    response = await call_next(request)
+
+    content_type = response.headers.get("content-type", "")
+    if not content_type.startswith(COMPRESSIBLE_TYPES) or "content-encoding" in response.headers:
+        return response
+    response.headers.add_vary_header("Accept-Encoding")
+
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+    content_length = response.headers.get("content-length")
+    if encoding is None or (content_length and int(content_length) < COMPRESSION_MIN_SIZE):
+        return response
+
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    compress = len(body) >= COMPRESSION_MIN_SIZE
+    if compress:
+        body = brotli.compress(body) if encoding == "br" else gzip.compress(body)
+
+    # Response sets content-length for the new body; every other header is
+    # copied from raw_headers so repeated ones (Set-Cookie, Vary) survive
+    new_response = Response(
+        content=body,
+        status_code=response.status_code,
+        background=response.background,
+    )
+    new_response.raw_headers.extend(
+        (key, value) for key, value in response.raw_headers if key.lower() != b"content-length"
+    )
+    if compress:
+        new_response.headers["content-encoding"] = encoding
+        # Each encoding is a distinct representation and needs its own strong validator
+        etag = new_response.headers.get("etag")
+        if etag and etag.endswith('"'):
+            new_response.headers["etag"] = f'{etag[:-1]}-{encoding}"'
+
+    return new_response
+
 class ShortlistJobRequest(BaseModel):
     user_id: str
     job_data: dict
@@ -171,6 +245,243 @@ resume_chain = (
     | parser
 )
 
+# Section-parallel resume parsing (optional, for long resumes)
+# When enabled, resumes longer than SECTION_PARSING_MIN_CHARS are split into
+# sections with a local heading heuristic and each section is parsed by its own
+# smaller LLM call. The calls run concurrently, so latency is bounded by the
+# largest section instead of the whole document.
+SECTION_PARSING_ENABLED = os.getenv("RESUME_SECTION_PARSING", "false").lower() in ("1", "true", "yes")
+SECTION_PARSING_MIN_CHARS = int(os.getenv("RESUME_SECTION_PARSING_MIN_CHARS", "6000"))
+SECTION_PARSING_MAX_CONCURRENCY = int(os.getenv("RESUME_SECTION_PARSING_MAX_CONCURRENCY", "6"))
+
+# Heading text (lowercased, without trailing colon) -> section name
+SECTION_HEADINGS = {
+    "experience": "experience",
+    "work experience": "experience",
+    "professional experience": "experience",
+    "relevant experience": "experience",
+    "employment": "experience",
+    "employment history": "experience",
+    "work history": "experience",
+    "career history": "experience",
+    "internships": "experience",
+    "education": "education",
+    "academic background": "education",
+    "academic qualifications": "education",
+    "educational qualifications": "education",
+    "qualifications": "education",
+    "projects": "projects",
+    "personal projects": "projects",
+    "academic projects": "projects",
+    "key projects": "projects",
+    "selected projects": "projects",
+    "skills": "skills",
+    "technical skills": "skills",
+    "key skills": "skills",
+    "core competencies": "skills",
+    "technologies": "skills",
+    "tools and technologies": "skills",
+    "certifications": "certifications",
+    "certificates": "certifications",
+    "licenses and certifications": "certifications",
+    "licenses & certifications": "certifications",
+    "courses": "certifications",
+    "summary": "summary",
+    "professional summary": "summary",
+    "profile": "summary",
+    "objective": "summary",
+    "career objective": "summary",
+    "about me": "summary",
+    "publications": "summary",
+    "awards": "summary",
+    "achievements": "summary",
+    "honors and awards": "summary",
+    "interests": "summary",
+}
+
+# JSON structure requested for each section; mirrors the fields of resume_prompt
+SECTION_SCHEMAS = {
+    "header": """{
+    "personal_info": {"name": "string", "contact": "string", "location": "string"},
+    "keywords": ["string", ...]
+}""",
+    "summary": """{
+    "keywords": ["string", ...]
+}""",
+    "skills": """{
+    "skills": ["skill1", "skill2", ...],
+    "keywords": ["string", ...]
+}""",
+    "education": """{
+    "education": [{"degree": "string", "institution": "string", "year": "string"}, ...],
+    "keywords": ["string", ...]
+}""",
+    "experience": """{
+    "experience": [
+        {
+            "position": "string",
+            "company": "string",
+            "duration": "string",
+            "responsibilities": ["string", ...],
+            "achievements": ["string", ...]
+        },
+        ...
+    ],
+    "skills": ["string", ...],
+    "keywords": ["string", ...]
+}""",
+    "projects": """{
+    "projects": [{"name": "string", "description": "string", "technologies": ["string", ...]}, ...],
+    "skills": ["string", ...],
+    "keywords": ["string", ...]
+}""",
+    "certifications": """{
+    "certifications": ["string", ...],
+    "keywords": ["string", ...]
+}""",
+}
+
+# Sections that may be dropped on failure without losing core resume data;
+# summary only contributes keywords
+OPTIONAL_SECTIONS = ("summary",)
+
+section_prompt = PromptTemplate(
+    input_variables=["section_name", "section_text", "schema"],
+    template="""
+You are an expert resume analyzer. The following text is the "{section_name}" section of a longer resume.
+Extract only the information present in this section:
+
+{section_text}
+
+Return ONLY the JSON response with no additional explanation. Follow this exact structure:
+{schema}
+"""
+)
+
+section_chain = section_prompt | llm | parser
+
+def split_resume_sections(resume_text):
+    """
+    Split resume text into sections using known headings.
+    Text before the first heading is returned as the "header" section.
+    Repeated headings of the same kind are concatenated.
+    """
+    sections = {}
+    current = "header"
+    for line in resume_text.splitlines():
+        heading = re.sub(r"\s+", " ", line.strip().rstrip(":").strip()).lower()
+        if len(heading) <= 40 and heading in SECTION_HEADINGS:
+            current = SECTION_HEADINGS[heading]
+            continue
+        sections.setdefault(current, []).append(line)
+
+    return {
+        name: "\n".join(lines).strip()
+        for name, lines in sections.items()
+        if "\n".join(lines).strip()
+    }
+
+def _dedupe_strings(values):
+    seen = set()
+    result = []
+    for value in values:
+        if not isinstance(value, str) or not value.strip():
+            continue
+        key = value.strip().lower()
+        if key not in seen:
+            seen.add(key)
+            result.append(value.strip())
+    return result
+
+def _string_list(value):
+    """Coerce an LLM string-list field; comma-separated strings are split"""
+    if isinstance(value, list):
+        return [item for item in value if isinstance(item, str)]
+    if isinstance(value, str):
+        return [item.strip() for item in value.split(",") if item.strip()]
+    return []
+
+def _record_list(value):
+    """Coerce an LLM record-list field, keeping only dict entries"""
+    if isinstance(value, dict):
+        return [value]
+    if isinstance(value, list):
+        return [item for item in value if isinstance(item, dict)]
+    return []
+
+def merge_section_results(results):
+    """Merge per-section parser outputs into the resume_prompt output schema"""
+    combined = {
+        "personal_info": {"name": "", "contact": "", "location": ""},
+        "skills": [],
+        "education": [],
+        "experience": [],
+        "projects": [],
+        "certifications": [],
+        "keywords": [],
+    }
+    for result in results:
+        personal_info = result.get("personal_info")
+        if isinstance(personal_info, dict):
+            for field, value in personal_info.items():
+                if isinstance(value, str) and value and not combined["personal_info"].get(field):
+                    combined["personal_info"][field] = value
+        for field in ("skills", "certifications", "keywords"):
+            combined[field].extend(_string_list(result.get(field)))
+        for field in ("education", "experience", "projects"):
+            combined[field].extend(_record_list(result.get(field)))
+
+    combined["skills"] = _dedupe_strings(combined["skills"])
+    combined["certifications"] = _dedupe_strings(combined["certifications"])
+    combined["keywords"] = _dedupe_strings(combined["keywords"])
+    # education/experience/projects each come from a single section call, so
+    # their records are kept as-is; similar entries (e.g. rejoining an
+    # employer) are genuinely different records
+    return combined
+
+def parse_resume_by_sections(resume_text):
+    """
+    Parse a resume with one concurrent LLM call per section.
+    Falls back to the single-prompt resume_chain when the text cannot be
+    segmented or any section other than the summary fails, so a failed call
+    never silently drops contact details, location, experience, skills or
+    education.
+    """
+    sections = split_resume_sections(resume_text)
+    if len(sections) < 2:
+        return resume_chain.invoke(resume_text)
+
+    inputs = [
+        {"section_name": name, "section_text": text, "schema": SECTION_SCHEMAS[name]}
+        for name, text in sections.items()
+    ]
+    results = section_chain.batch(
+        inputs,
+        config={"max_concurrency": SECTION_PARSING_MAX_CONCURRENCY},
+        return_exceptions=True,
+    )
+
+    parsed_sections = []
+    failed_sections = []
+    for section_input, result in zip(inputs, results):
+        if isinstance(result, Exception) or not isinstance(result, dict):
+            logger.error(f"Error parsing resume section {section_input['section_name']}: {result}")
+            failed_sections.append(section_input["section_name"])
+            continue
+        parsed_sections.append(result)
+
+    if not parsed_sections or any(name not in OPTIONAL_SECTIONS for name in failed_sections):
+        logger.info(f"Falling back to single-prompt parsing after failed sections: {failed_sections}")
+        return resume_chain.invoke(resume_text)
+
+    logger.info(f"Parsed resume in {len(parsed_sections)}/{len(inputs)} sections")
+    return merge_section_results(parsed_sections)
+
+def parse_resume(resume_text):
+    if SECTION_PARSING_ENABLED and len(resume_text) >= SECTION_PARSING_MIN_CHARS:
+        return parse_resume_by_sections(resume_text)
+    return resume_chain.invoke(resume_text)
+
 # Job Search Keywords Generator LLM Chain
 job_search_prompt = PromptTemplate(
     input_variables=["resume_data"],
@@ -455,12 +766,25 @@ def extract_text_from_pdf(file_content):
 def extract_text_from_docx(file_content):
     return docx2txt.process(io.BytesIO(file_content))
 
+UPLOAD_RESPONSE_FIELDS = ("resume_analysis", "search_keywords", "job_listings")
+
 @app.post("/api/upload-resume")
-async def upload_resume(file: UploadFile = File(...)):
+async def upload_resume(file: UploadFile = File(...), fields: Optional[str] = Query(None)):
     # Validate file extension
     if not file.filename.lower().endswith(('.pdf', '.docx')):
         raise HTTPException(status_code=400, detail="Only PDF and DOCX files are allowed")
     
+    # Validate requested response fields (?fields=search_keywords,job_listings)
+    if fields is not None:
+        selected_fields = [f.strip() for f in fields.split(",") if f.strip()]
+        if not selected_fields:
+            raise HTTPException(status_code=400, detail="At least one field must be selected")
+        unknown_fields = [f for f in selected_fields if f not in UPLOAD_RESPONSE_FIELDS]
+        if unknown_fields:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown_fields)}")
+    else:
+        selected_fields = UPLOAD_RESPONSE_FIELDS
+    
     # Read file content
     file_content = await file.read()
     
@@ -475,27 +799,32 @@ async def upload_resume(file: UploadFile = File(...)):
     
     try:
         # First agent: Parse resume
-        parsed_resume = resume_chain.invoke(resume_text)
+        parsed_resume = parse_resume(resume_text)
         
         # Extract user location from parsed resume
         user_location = parsed_resume.get("personal_info", {}).get("location", "").strip()
         
-        # Second agent: Generate job search keywords
-        search_keywords = job_search_chain.invoke(json.dumps(parsed_resume))
+        result = {"resume_analysis": parsed_resume}
         
-        # Third agent: Search for real jobs with location consideration
-        job_listings = search_jobs_jsearch(search_keywords, user_location)
+        # Second agent: Generate job search keywords.
+        # Skipped when neither keywords nor job listings were requested.
+        if "search_keywords" in selected_fields or "job_listings" in selected_fields:
+            search_keywords = job_search_chain.invoke(json.dumps(parsed_resume))
+            result["search_keywords"] = search_keywords
         
-        # If JSearch fails, try Adzuna as backup
-        if not job_listings:
-            job_listings = search_jobs_adzuna(search_keywords, user_location)
+        # Third agent: Search for real jobs with location consideration.
+        # Skipped when the client did not ask for job listings to save API quota.
+        if "job_listings" in selected_fields:
+            job_listings = search_jobs_jsearch(search_keywords, user_location)
+            
+            # If JSearch fails, try Adzuna as backup
+            if not job_listings:
+                job_listings = search_jobs_adzuna(search_keywords, user_location)
+            
+            result["job_listings"] = job_listings
         
-        # Return the full result
-        return {
-            "resume_analysis": parsed_resume,
-            "search_keywords": search_keywords,
-            "job_listings": job_listings
-        }
+        # Return the requested parts of the result
+        return {field: result[field] for field in selected_fields}
     
     except Exception as e:
         print(f"Error processing resume: {e}")
@@ -509,6 +838,37 @@ def get_database():
         raise RuntimeError("MONGODB_URI environment variable not set")
     client = MongoClient(CONNECTION_STRING)
     return client["jobnexus"]
+
+def shortlist_etag(user_id, version):
+    # shortlistVersion is incremented on every shortlist/remove, so it
+    # identifies the list contents without reading or serializing them
+    return f'"{user_id}-{version}"'
+
+def normalize_etag(etag):
+    """Strip the W/ prefix and the -gzip/-br suffix added by compress_response"""
+    etag = etag.strip().removeprefix("W/")
+    for encoding in ("gzip", "br"):
+        suffix = f'-{encoding}"'
+        if etag.endswith(suffix):
+            return etag[:-len(suffix)] + '"'
+    return etag
+
+def matching_etag(if_none_match, etag):
+    """
+    Return the If-None-Match entry that matches etag, or None.
+    Uses weak comparison (RFC 9110 13.1.2), so W/ prefixes added by proxies
+    are ignored, as are the per-encoding suffixes. The client's own tag is
+    returned so a 304 echoes the validator of the representation it holds.
+    """
+    if not if_none_match:
+        return None
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return etag
+        if normalize_etag(tag) == normalize_etag(etag):
+            return tag
+    return None
     
 @app.post("/api/shortlist-job")
 async def shortlist_job(request: ShortlistJobRequest):
@@ -545,7 +905,10 @@ async def shortlist_job(request: ShortlistJobRequest):
         # Add job to user's shortlisted jobs using $addToSet to prevent duplicates
         result = user_collection.update_one(
             {"_id": ObjectId(request.user_id)},
-            {"$addToSet": {"shortlistedJobs": job_data_with_metadata}}
+            {
+                "$addToSet": {"shortlistedJobs": job_data_with_metadata},
+                "$inc": {"shortlistVersion": 1}
+            }
         )
         
         if result.modified_count == 0:
@@ -566,7 +929,7 @@ async def shortlist_job(request: ShortlistJobRequest):
         raise HTTPException(status_code=500, detail="Internal server error while shortlisting job")
 
 @app.get("/api/shortlisted-jobs/{user_id}")
-async def get_shortlisted_jobs(user_id: str):
+async def get_shortlisted_jobs(user_id: str, if_none_match: Optional[str] = Header(None)):
     try:
         # Validate user_id format
         if not ObjectId.is_valid(user_id):
@@ -576,6 +939,24 @@ async def get_shortlisted_jobs(user_id: str):
         db = get_database()  # Replace with your database connection method
         user_collection = db["users"]  # Replace with your actual collection name
         
+        # Check the shortlist version first so unchanged lists are answered with 304
+        version_doc = user_collection.find_one(
+            {"_id": ObjectId(user_id)},
+            {"shortlistVersion": 1, "_id": 0}
+        )
+        
+        if not version_doc:
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        etag = shortlist_etag(user_id, version_doc.get("shortlistVersion", 0))
+        cache_headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        matched_etag = matching_etag(if_none_match, etag)
+        if matched_etag:
+            return Response(
+                status_code=304,
+                headers={"ETag": matched_etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+            )
+        
         # Fetch user's shortlisted jobs
         user = user_collection.find_one(
             {"_id": ObjectId(user_id)},
@@ -601,10 +982,13 @@ async def get_shortlisted_jobs(user_id: str):
         
         logger.info(f"Retrieved {len(active_jobs)} shortlisted jobs for user {user_id}")
         
-        return {
-            "shortlisted_jobs": active_jobs,
-            "total_count": len(active_jobs)
-        }
+        return JSONResponse(
+            content=jsonable_encoder({
+                "shortlisted_jobs": active_jobs,
+                "total_count": len(active_jobs)
+            }),
+            headers=cache_headers
+        )
         
     except HTTPException:
         raise
@@ -640,7 +1024,10 @@ async def remove_shortlisted_job(request: RemoveShortlistRequest):
         # Remove job from user's shortlisted jobs
         result = user_collection.update_one(
             {"_id": ObjectId(request.user_id)},
-            {"$pull": {"shortlistedJobs": {"jobId": request.job_id}}}
+            {
+                "$pull": {"shortlistedJobs": {"jobId": request.job_id}},
+                "$inc": {"shortlistVersion": 1}
+            }
         )
         
         if result.modified_count == 0: